@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import yfinance as yf
 import plotly.graph_objects as go
 import plotly.express as px
+import time
 from datetime import datetime, timedelta, timezone
 
 # Page Config
@@ -40,122 +42,103 @@ TICKER_NAMES = {
     "601138.SS": "工业富联"
 }
 
+# Structure-of-arrays view of HOLDINGS (fixed for the session).
+# Per-holding market data is carried as ndarrays aligned to TICKERS.
+TICKERS = np.array(list(HOLDINGS.keys()))
+WEIGHTS = np.array(list(HOLDINGS.values()), dtype=np.float64)
+NAMES = np.array([TICKER_NAMES.get(t, t) for t in TICKERS])
+TOTAL_WEIGHT = WEIGHTS.sum()
+# Symbols for the batched yfinance request (holdings + NQ=F)
+DOWNLOAD_SYMBOLS = " ".join(list(HOLDINGS.keys()) + ["NQ=F"])
+
 # --- Helper Functions ---
 def get_change_color(change):
     return "red" if change >= 0 else "green"
 
+@st.cache_data(ttl=60, show_spinner=False)
+def _download_history():
+    """Raw daily history for all holdings plus NQ=F in one batched request (cached, shared across reruns)
+
+    Returns (df, fetched_at) so callers can show when the data was actually downloaded.
+    """
+    # Batch fetch for A-shares might be slow with yfinance, but it's the standard requested way.
+    # Only the last two closes are used, so try period='2d' first and fall back to
+    # period='5d' unless every holding and NQ=F has two valid closes (holidays, suspensions)
+    df_all = yf.download(DOWNLOAD_SYMBOLS, period="2d", interval="1d", progress=False)
+    closes = df_all.get('Close')
+    if (closes is None
+            or closes.reindex(columns=TICKERS).count().min() < 2
+            or 'NQ=F' not in closes or closes['NQ=F'].count() < 2):
+        df_all = yf.download(DOWNLOAD_SYMBOLS, period="5d", interval="1d", progress=False)
+    return df_all, datetime.now(timezone(timedelta(hours=8)))
+
+def _fetch_last_change(symbol):
+    """Last close and day-over-day % change for a single symbol, (0.0, 0.0) on failure"""
+    try:
+        ticker = yf.Ticker(symbol)
+        hist = ticker.history(period="2d")
+        if len(hist) < 2:
+            hist = ticker.history(period="5d")
+        if len(hist) >= 2:
+            last = hist['Close'].iloc[-1]
+            prev = hist['Close'].iloc[-2]
+            return (last - prev) / prev, last
+        return 0.0, 0.0
+    except Exception as e:
+        st.error(f"Error fetching {symbol}: {e}")
+        return 0.0, 0.0
+
+@st.cache_data(ttl=60, max_entries=4, show_spinner=False)
 def fetch_data():
     """Fetches real-time data for holdings and NQ=F"""
     data_cache = {}
     
-    # Fetch Holdings Data
-    tickers = list(HOLDINGS.keys())
+    # Defaults, kept if the download or parsing fails
+    data_cache['holdings_change'] = np.zeros(len(TICKERS))
+    data_cache['holdings_price'] = np.zeros(len(TICKERS))
+    data_cache['nq_change'] = 0.0
+    data_cache['nq_price'] = 0.0
+    data_cache['fetched_at'] = datetime.now(timezone(timedelta(hours=8)))
+
+    # Fetch Holdings + NQ=F (one batched request, downloaded once)
     try:
-        # Batch fetch for A-shares might be slow with yfinance, but it's the standard requested way.
-        # Check if we need to adjust for market hours (using 'today' or 'last close')
-        # Using period='5d' to ensure we get data even if market is closed/weekend
-        valid_tickers = " ".join(tickers)
-        df_holdings = yf.download(valid_tickers, period="5d", interval="1d", progress=False)
-        
-        # Get latest % change for each
         # yfinance multi-index columns: (Price Type, Ticker)
-        # We need 'Close'
-        current_changes = {}
-        quotes = {}
+        # We need 'Close' -> DataFrame: rows=dates, cols=tickers
+        df_all, data_cache['fetched_at'] = _download_history()
+        close_all = df_all['Close']
         
-        for ticker in tickers:
-            try:
-                # Extract Close series
-                closes = df_holdings['Close'][ticker].dropna()
-                if len(closes) >= 2:
-                    last_close = closes.iloc[-1]
-                    prev_close = closes.iloc[-2]
-                    change_pct = (last_close - prev_close) / prev_close
-                    current_changes[ticker] = change_pct
-                    quotes[ticker] = last_close
-                else:
-                    current_changes[ticker] = 0.0
-                    quotes[ticker] = 0.0
-            except Exception as e:
-                print(f"Error processing {ticker}: {e}")
-                current_changes[ticker] = 0.0
-                quotes[ticker] = 0.0
-                
-        data_cache['holdings_change'] = current_changes
-        data_cache['holdings_price'] = quotes
-        
-    except Exception as e:
-        st.error(f"Error fetching holdings data: {e}")
-        data_cache['holdings_change'] = {t: 0.0 for t in tickers}
-        data_cache['holdings_price'] = {t: 0.0 for t in tickers}
+        # Get latest % change for each holding
+        # reindex keeps missing tickers as NaN columns (-> 0.0 below) instead of raising
+        # Drop dates on which only NQ=F traded so A-share holidays don't shift iloc[-2]
+        close_block = close_all.reindex(columns=TICKERS).dropna(how='all').ffill()
+        if len(close_block) >= 2:
+            last = close_block.iloc[-1]
+            prev = close_block.iloc[-2]
+            data_cache['holdings_change'] = ((last - prev) / prev).fillna(0.0).to_numpy()
+            data_cache['holdings_price'] = last.fillna(0.0).to_numpy()
 
-    # Fetch NQ=F
-    try:
-        nq = yf.Ticker("NQ=F")
-        nq_hist = nq.history(period="5d")
-        if len(nq_hist) >= 2:
-            nq_last = nq_hist['Close'].iloc[-1]
-            nq_prev = nq_hist['Close'].iloc[-2]
-            nq_change = (nq_last - nq_prev) / nq_prev
-            data_cache['nq_change'] = nq_change
+        # NQ=F
+        nq_closes = close_all['NQ=F'].dropna()
+        if len(nq_closes) >= 2:
+            nq_last = nq_closes.iloc[-1]
+            nq_prev = nq_closes.iloc[-2]
+            data_cache['nq_change'] = (nq_last - nq_prev) / nq_prev
             data_cache['nq_price'] = nq_last
-        else:
-            data_cache['nq_change'] = 0.0
-            data_cache['nq_price'] = 0.0
             
     except Exception as e:
-        st.error(f"Error fetching NQ=F: {e}")
-        data_cache['nq_change'] = 0.0
-        data_cache['nq_price'] = 0.0
+        st.error(f"Error fetching holdings/NQ=F data: {e}")
         
-    # Fetch NVDA
-    try:
-        nvda = yf.Ticker("NVDA")
-        nvda_hist = nvda.history(period="5d")
-        if len(nvda_hist) >= 2:
-            nvda_last = nvda_hist['Close'].iloc[-1]
-            nvda_prev = nvda_hist['Close'].iloc[-2]
-            nvda_change = (nvda_last - nvda_prev) / nvda_prev
-            data_cache['nvda_change'] = nvda_change
-            data_cache['nvda_price'] = nvda_last
-        else:
-            data_cache['nvda_change'] = 0.0
-            data_cache['nvda_price'] = 0.0
-    except Exception as e:
-        st.error(f"Error fetching NVDA: {e}")
-        data_cache['nvda_change'] = 0.0
-        data_cache['nvda_price'] = 0.0
-
-    # Fetch COHR
-    try:
-        cohr = yf.Ticker("COHR")
-        cohr_hist = cohr.history(period="5d")
-        if len(cohr_hist) >= 2:
-            cohr_last = cohr_hist['Close'].iloc[-1]
-            cohr_prev = cohr_hist['Close'].iloc[-2]
-            cohr_change = (cohr_last - cohr_prev) / cohr_prev
-            data_cache['cohr_change'] = cohr_change
-            data_cache['cohr_price'] = cohr_last
-        else:
-            data_cache['cohr_change'] = 0.0
-            data_cache['cohr_price'] = 0.0
-    except Exception as e:
-        st.error(f"Error fetching COHR: {e}")
-        data_cache['cohr_change'] = 0.0
-        data_cache['cohr_price'] = 0.0
+    # Fetch US bellwethers (NVDA, COHR)
+    for symbol in ("NVDA", "COHR"):
+        change, price = _fetch_last_change(symbol)
+        data_cache[f'{symbol.lower()}_change'] = change
+        data_cache[f'{symbol.lower()}_price'] = price
         
     return data_cache
 
 def calculate_fund_sim(holdings_changes):
     """Core Logic 1: Fund Simulation"""
-    total_weighted_change = 0.0
-    total_weight = sum(HOLDINGS.values())
-    
-    for ticker, weight in HOLDINGS.items():
-        change = holdings_changes.get(ticker, 0.0)
-        total_weighted_change += change * weight
-        
-    sim_change = total_weighted_change / total_weight
+    sim_change = float(holdings_changes @ WEIGHTS) / TOTAL_WEIGHT
     return sim_change
 
 def check_signals(data, fund_sim_change):
@@ -168,8 +151,9 @@ def check_signals(data, fund_sim_change):
         signals.append(f"⚠️ 美股剧震警报: NQ=F 波动 {nq_change:.2%}")
         
     # 2. Arbitrage: (NQ_Change - Fund_Sim_Change) > 1.0%
-    if (nq_change - fund_sim_change) > 0.01:
-        signals.append(f"💰以此套利机会: 纳指 vs 基金溢价 > 1.0% (Diff: {(nq_change - fund_sim_change):.2%})")
+    diff = nq_change - fund_sim_change
+    if diff > 0.01:
+        signals.append(f"💰以此套利机会: 纳指 vs 基金溢价 > 1.0% (Diff: {diff:.2%})")
 
     # 3. Sentiment: Spread(Eoptolink - InnoLight) > +/- 3.0%
     # Mapping assumed: 300502 (Zhongji/InnoLight?), 301377?
@@ -180,33 +164,81 @@ def check_signals(data, fund_sim_change):
     # Eoptolink Technology Inc is 300502. 
     # InnoLight is 300308? No. 
     # Let's rely on the Top 2 keys for the spread as they are the largest weights: 
-    # 300502.SZ and 301377.SZ.
-    t1 = "300502.SZ"
-    t2 = "301377.SZ"
-    c1 = data['holdings_change'].get(t1, 0.0)
-    c2 = data['holdings_change'].get(t2, 0.0)
-    
-    spread = c1 - c2
+    # 300502.SZ and 301377.SZ, i.e. positions 0 and 1 of the TICKERS-aligned array.
+    changes = data['holdings_change']
+    spread = changes[0] - changes[1]
     if abs(spread) > 0.03:
+         t1, t2 = TICKERS[0], TICKERS[1]
          signals.append(f"📊 情绪背离: 龙头股价差 > 3.0% ({t1} vs {t2})")
          
     return signals
 
+@st.cache_data(ttl=60, show_spinner=False)
+def build_contrib_fig(changes_tuple):
+    """Weighted contribution bar chart, cached on the per-holding changes (aligned to TICKERS)"""
+    changes = np.array(changes_tuple, dtype=np.float64)
+    contribs = changes * WEIGHTS
+    # Sort by contribution for better visualization
+    order = np.argsort(contribs)
+    df_contrib = pd.DataFrame({
+        "股票名称": NAMES[order],
+        "贡献度": contribs[order],
+        "权重": WEIGHTS[order],
+        "涨跌幅": changes[order],
+    })
+    
+    fig_contrib = px.bar(df_contrib, y='股票名称', x='贡献度', 
+                         title="基金净值加权贡献度 (按贡献排序)",
+                         color='贡献度',
+                         orientation='h',
+                         text_auto='.3%',
+                         color_continuous_scale=['green', 'red'])
+    
+    fig_contrib.update_traces(marker_color=np.where(df_contrib['贡献度'].to_numpy() >= 0, 'red', 'green'), textposition='outside')
+    fig_contrib.update_layout(yaxis_title=None, xaxis_title="贡献度")
+    return fig_contrib
+
+@st.cache_data(ttl=60, show_spinner=False)
+def build_resonance_fig(nq_change, fund_sim):
+    """NQ=F vs fund estimate snapshot bar chart"""
+    comp_df = pd.DataFrame({
+        "资产": ["纳指期货 (NQ=F)", "基金估算"],
+        "涨跌幅": [nq_change, fund_sim]
+    })
+    return px.bar(comp_df, x="资产", y="涨跌幅", color="涨跌幅", title="快照对比")
+
+def build_details_df(data):
+    """Holdings detail table: labels in the index, numerics in one float64 block"""
+    # Change is stored in percent points, rendered by column_config as "%.2f%%"
+    numeric = np.column_stack([WEIGHTS, data['holdings_price'], data['holdings_change'] * 100])
+    return pd.DataFrame(numeric, columns=["权重", "当前价格", "涨跌幅"],
+                        index=pd.MultiIndex.from_arrays([TICKERS, NAMES], names=["代码", "名称"]))
+
 # --- Main App ---
 st.title("全球 CPO 监控 V6.0 🌍")
 st.caption(f"跟踪基金: {FUND_CODE} | 实时模拟")
-beijing_time = datetime.now(timezone(timedelta(hours=8))).strftime('%H:%M:%S')
-st.caption(f"最后刷新时间: {beijing_time} (北京时间)")
 
-# Fetch Data
-with st.spinner('Fetching Real-time Data...'):
-    market_data = fetch_data()
+# Reuse the computed payload for reruns within the same minute (tab switches, widget clicks)
+bucket = int(time.time() // 60)
+if st.session_state.get('cpo_bucket') == bucket:
+    market_data, fund_sim_val, alerts, df_details = st.session_state['cpo_payload']
+else:
+    # Fetch Data
+    with st.spinner('Fetching Real-time Data...'):
+        market_data = fetch_data()
+
+    # Calculations
+    fund_sim_val = calculate_fund_sim(market_data['holdings_change'])
+    alerts = check_signals(market_data, fund_sim_val)
+    df_details = build_details_df(market_data)
 
-# Calculations
-fund_sim_val = calculate_fund_sim(market_data['holdings_change'])
-alerts = check_signals(market_data, fund_sim_val)
+    st.session_state['cpo_payload'] = (market_data, fund_sim_val, alerts, df_details)
+    st.session_state['cpo_bucket'] = bucket
+
+# Payload and downloads are cached, so show when the data was fetched, not when the page reran
+beijing_time = market_data['fetched_at'].strftime('%H:%M:%S')
+st.caption(f"最后刷新时间: {beijing_time} (北京时间)")
 
-# Alerts Toast
 # Alerts Toast
 if 'last_alerts' not in st.session_state:
     st.session_state['last_alerts'] = []
@@ -252,26 +284,8 @@ tab1, tab2, tab3 = st.tabs(["📈 归因分析", "🔗 共振监测", "📋 持
 with tab1:
     st.write("##### 前十大重仓股贡献度")
     # Bar chart of weighted contribution
-    contrib_data = []
-    for t, w in HOLDINGS.items():
-        chg = market_data['holdings_change'].get(t, 0.0)
-        contrib = chg * w
-        name = TICKER_NAMES.get(t, t)
-        contrib_data.append({"股票名称": name, "贡献度": contrib, "权重": w, "涨跌幅": chg})
-    
-    df_contrib = pd.DataFrame(contrib_data)
-    # Sort by contribution for better visualization
-    df_contrib = df_contrib.sort_values(by="贡献度", ascending=True)
-    
-    fig_contrib = px.bar(df_contrib, y='股票名称', x='贡献度', 
-                         title="基金净值加权贡献度 (按贡献排序)",
-                         color='贡献度',
-                         orientation='h',
-                         text_auto='.3%',
-                         color_continuous_scale=['green', 'red'])
-    
-    fig_contrib.update_traces(marker_color=df_contrib['贡献度'].apply(lambda x: 'red' if x >= 0 else 'green'), textposition='outside')
-    fig_contrib.update_layout(yaxis_title=None, xaxis_title="贡献度")
+    changes_tuple = tuple(market_data['holdings_change'].tolist())
+    fig_contrib = build_contrib_fig(changes_tuple)
     st.plotly_chart(fig_contrib, use_container_width=True)
 
 with tab2:
@@ -280,31 +294,18 @@ with tab2:
     # Real implementation would require historical data fetching
     st.info("历史共振图表需要加载历史数据。目前仅显示快照对比。")
     
-    comp_df = pd.DataFrame({
-        "资产": ["纳指期货 (NQ=F)", "基金估算"],
-        "涨跌幅": [market_data.get('nq_change', 0.0), fund_sim_val]
-    })
-    fig_res = px.bar(comp_df, x="资产", y="涨跌幅", color="涨跌幅", title="快照对比")
+    fig_res = build_resonance_fig(float(market_data.get('nq_change', 0.0)), float(fund_sim_val))
     st.plotly_chart(fig_res, use_container_width=True)
 
 with tab3:
     st.write("##### 前十大重仓股详情")
     # Display Data Table
-    df_details = pd.DataFrame(list(HOLDINGS.items()), columns=["Ticker", "权重"])
-    df_details["名称"] = df_details["Ticker"].map(TICKER_NAMES)
-    df_details["当前价格"] = df_details["Ticker"].map(market_data['holdings_price'])
-    df_details["涨跌幅"] = df_details["Ticker"].map(market_data['holdings_change'])
-    
-    # Reorder and Rename Ticker to Code
-    df_details = df_details.rename(columns={"Ticker": "代码"})
-    df_details = df_details[["代码", "名称", "权重", "当前价格", "涨跌幅"]]
-
-    # Formatting
-    st.dataframe(df_details.style.format({
-        "权重": "{:.4f}",
-        "当前价格": "{:.2f}",
-        "涨跌幅": "{:.2%}"
-    }))
+    # Formatting happens on the frontend, no pandas Styler pass
+    st.dataframe(df_details, column_config={
+        "权重": st.column_config.NumberColumn(format="%.4f"),
+        "当前价格": st.column_config.NumberColumn(format="%.2f"),
+        "涨跌幅": st.column_config.NumberColumn(format="%.2f%%"),
+    }, use_container_width=True)
 
 # Footer
 st.markdown("---")